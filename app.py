@@ -1,9 +1,19 @@
 import streamlit as st
+import os
 import subprocess
 import sys
+import time
+import threading
 import re
-import json
+import sqlite3
+import asyncio
+import logging
+import logging.handlers
+import httpx
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from contextlib import closing
 from datetime import datetime
 from pathlib import Path
 from retrieval import get_retriever
@@ -47,62 +57,257 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_API_URL = f"{OLLAMA_BASE_URL}/api/generate"
 OLLAMA_MODEL = "llama3"
+OLLAMA_SYSTEM_PROMPT = "You are a recruitment assistant. Provide a concise, professional response."
+OLLAMA_KEEP_ALIVE = "10m"  # Keep the model (and its prompt cache) loaded between requests
+OLLAMA_JSON_HEADERS = {"Content-Type": "application/json"}
+OLLAMA_CONNECT_TIMEOUT = 5
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "20"))
+OLLAMA_RETRY_BACKOFF = (2, 4)  # Seconds to wait before each retry after a read timeout
+INDEX_DIR = Path("data/index")
+AI_BATCH_SIZE = 8  # Candidates per batched analysis prompt; larger batches slow decoding
+
+JD_SKILL_KEYWORDS = [
+    'python', 'java', 'sql', 'aws', 'docker', 'kubernetes', 'react',
+    'node', 'machine learning', 'nlp', 'pytorch', 'agile', 'scrum'
+]
+# Single-pass alternation; word boundaries keep 'java' from matching 'javascript'
+_JD_SKILL_RE = re.compile(r'\b(' + '|'.join(map(re.escape, JD_SKILL_KEYWORDS)) + r')\b')
+
+# Audit trail for privacy-sensitive actions. Streamlit re-executes this module on
+# every rerun, so the handler is only attached once per process.
+LOG_DIR = Path("data/logs")
+LOG_DIR.mkdir(parents=True, exist_ok=True)
+_audit_logger = logging.getLogger("avs.audit")
+if not _audit_logger.handlers:
+    _audit_logger.setLevel(logging.INFO)
+    _audit_logger.propagate = False
+    _audit_handler = logging.handlers.RotatingFileHandler(
+        LOG_DIR / "audit.log", maxBytes=5_000_000, backupCount=5
+    )
+    _audit_handler.setFormatter(logging.Formatter("%(asctime)s | %(message)s"))
+    _audit_logger.addHandler(_audit_handler)
+
+# Queries retrieval alone can answer, e.g. "Find candidates with Python"
+_SEARCH_VERB_RE = re.compile(r'^\s*(?:please\s+)?(?:find|show|list|get|search(?:\s+for)?)\b', re.IGNORECASE)
+_NEEDS_LLM_RE = re.compile(r'compare|analy[sz]e|why|summari[sz]e|tell me about|explain|recommend', re.IGNORECASE)
 
 # --- Helper Functions ---
 
+@st.cache_resource
+def get_http_session():
+    """Shared keep-alive session so Ollama calls reuse pooled sockets across reruns."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=0)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip"})
+    return session
+
 def ensure_data_exists():
     """Checks for data and builds indexes if missing."""
     parsed_dir = Path("data/parsed")
-    index_dir = Path("data/index")
     
-    if not parsed_dir.exists() or not list(parsed_dir.glob("*.json")):
+    # Runs on every rerun: stop at the first profile instead of listing them all
+    if not parsed_dir.exists() or next(parsed_dir.glob("*.json"), None) is None:
         st.warning("No candidate data found.")
         st.info("Please add resumes to 'data/resumes/' and run the parsing script.")
         st.stop()
     
-    if not (index_dir / "faiss.index").exists():
-        with st.spinner("Building search indexes..."):
-            try:
-                subprocess.run([sys.executable, "build_faiss.py"], check=True)
-                subprocess.run([sys.executable, "build_fts.py"], check=True)
-                st.success("Indexes built successfully.")
-                st.rerun()
-            except Exception as e:
-                st.error(f"Failed to build indexes: {e}")
-                st.stop()
+    if not indexes_ready():
+        build = start_index_build()
+        if not build['thread'].is_alive() and build['error'] is None and not indexes_ready():
+            # An earlier build in this process succeeded but its output has since gone
+            start_index_build.clear()
+            build = start_index_build()
+        if build['thread'].is_alive():
+            # Poll instead of blocking the script thread for the whole build
+            st.info("Building search indexes in the background. This page will refresh when done.")
+            time.sleep(2)
+            st.rerun()
+
+        # The thread has exited; join so its result is visible before checking it
+        build['thread'].join()
+        if build['error'] is not None or not indexes_ready():
+            # Clear so the next visit retries
+            start_index_build.clear()
+            st.error(f"Failed to build indexes: {build['error'] or 'the build did not complete'}")
+            st.stop()
+
+def indexes_ready():
+    """True once build_faiss.py and build_fts.py have both written their output."""
+    try:
+        # build_faiss.py writes meta.json after faiss.index, so an older one is a partial build
+        if (INDEX_DIR / "meta.json").stat().st_mtime < (INDEX_DIR / "faiss.index").stat().st_mtime:
+            return False
+        with closing(sqlite3.connect(f"file:{INDEX_DIR / 'meta.sqlite'}?mode=ro", uri=True)) as conn:
+            return conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='profiles_fts'"
+            ).fetchone() is not None
+    except (OSError, sqlite3.Error):
+        return False
+
+@st.cache_resource
+def start_index_build():
+    """Starts the index build once per process; concurrent sessions share it."""
+    build = {'error': None}
 
+    def run():
+        try:
+            subprocess.run([sys.executable, "build_faiss.py"], check=True)
+            subprocess.run([sys.executable, "build_fts.py"], check=True)
+        except Exception as e:
+            build['error'] = e
+
+    build['thread'] = threading.Thread(target=run, daemon=True)
+    build['thread'].start()
+    return build
+
+@st.cache_data(ttl=15, show_spinner=False)
 def check_ollama_available():
     """Checks if local LLM is running."""
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=1)
+        # Cheap HEAD probe with a short timeout so an offline Ollama doesn't stall page load
+        response = get_http_session().head(f"{OLLAMA_BASE_URL}/", timeout=0.25)
         return response.status_code == 200
     except:
         return False
 
-def chat_with_ollama(prompt, context=""):
+def build_ollama_payload(prompt, context="", num_predict=300):
+    """Builds the generate-API request body for a single prompt."""
+    return {
+        "model": OLLAMA_MODEL,
+        # Identical system string on every call lets Ollama reuse its cached prefill
+        "system": OLLAMA_SYSTEM_PROMPT,
+        "prompt": f"Context: {context}\nUser Query: {prompt}",
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"temperature": 0.3, "num_predict": num_predict}
+    }
+
+def chat_with_ollama(prompt, context="", num_predict=300):
     """Interacts with local LLM."""
     try:
-        full_prompt = f"""You are a recruitment assistant.
-        Context: {context}
-        User Query: {prompt}
-        Provide a concise, professional response."""
-
-        payload = {
-            "model": OLLAMA_MODEL,
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {"temperature": 0.3, "num_predict": 300}
-        }
-        
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=30)
+        body = orjson.dumps(build_ollama_payload(prompt, context, num_predict))
+        for delay in (*OLLAMA_RETRY_BACKOFF, None):
+            try:
+                response = get_http_session().post(
+                    OLLAMA_API_URL, data=body, headers=OLLAMA_JSON_HEADERS,
+                    timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+                )
+                break
+            except requests.exceptions.ReadTimeout:
+                if delay is None:
+                    raise
+                time.sleep(delay)
+        if response.status_code == 200:
+            return orjson.loads(response.content)["response"]
+        return "AI processing failed."
+    except Exception as e:
+        return f"AI Connection Error: {e}"
+
+def stream_chat_with_ollama(prompt, placeholder, context="", prefix=""):
+    """Streams the LLM response into a Streamlit placeholder token by token."""
+    out = ""
+    try:
+        body = orjson.dumps({**build_ollama_payload(prompt, context), "stream": True})
+        with get_http_session().post(
+            OLLAMA_API_URL, data=body, headers=OLLAMA_JSON_HEADERS, stream=True,
+            timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+        ) as response:
+            if response.status_code != 200:
+                out = "AI processing failed."
+            else:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    out += orjson.loads(line).get("response", "")
+                    placeholder.markdown(prefix + out)
+    except Exception as e:
+        out = f"AI Connection Error: {e}"
+    placeholder.markdown(prefix + out)
+    return out
+
+async def _achat(client, prompt, context="", num_predict=300):
+    """Async counterpart of chat_with_ollama on a shared httpx client."""
+    try:
+        body = orjson.dumps(build_ollama_payload(prompt, context, num_predict))
+        for delay in (*OLLAMA_RETRY_BACKOFF, None):
+            try:
+                response = await client.post("/api/generate", content=body, headers=OLLAMA_JSON_HEADERS)
+                break
+            except httpx.ReadTimeout:
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
         if response.status_code == 200:
-            return response.json()["response"]
+            return orjson.loads(response.content)["response"]
         return "AI processing failed."
     except Exception as e:
         return f"AI Connection Error: {e}"
 
+async def _run_many(prompts, num_predict):
+    limits = httpx.Limits(max_connections=8)
+    timeout = httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT)
+    async with httpx.AsyncClient(base_url=OLLAMA_BASE_URL, timeout=timeout, limits=limits) as client:
+        return await asyncio.gather(*(_achat(client, p, num_predict=num_predict) for p in prompts))
+
+def chat_with_ollama_many(prompts, num_predict=300):
+    """Runs independent prompts concurrently; Ollama serves them in parallel up to OLLAMA_NUM_PARALLEL."""
+    if len(prompts) <= 1:
+        return [chat_with_ollama(p, num_predict=num_predict) for p in prompts]
+    return asyncio.run(_run_many(prompts, num_predict))
+
+def format_candidate_for_ai(profile):
+    """Condenses a profile into a single line of LLM context."""
+    skills = ", ".join(s['name'] for s in profile.get('skills', [])[:8])
+    return (f"{profile.get('name', 'Candidate')} | {profile.get('role_category', 'N/A')} | "
+            f"{profile.get('experience_years', 0)} yrs | Skills: {skills}")
+
+def chat_with_ollama_batch(profiles):
+    """Analyzes several candidates in one LLM round-trip instead of one call each."""
+    batches = [profiles[i:i + AI_BATCH_SIZE] for i in range(0, len(profiles), AI_BATCH_SIZE)]
+    prompts = []
+    for batch in batches:
+        lines = [f"{i}. [{p['candidate_id']}] {p['_ai_blurb']}" for i, p in enumerate(batch, 1)]
+        prompts.append("For each candidate below, return a JSON object mapping the candidate id "
+                       "(in brackets) to a one-sentence fit analysis.\nCandidates:\n" + "\n".join(lines))
+
+    analyses = {}
+    raw_responses = chat_with_ollama_many(prompts, num_predict=80 * AI_BATCH_SIZE)
+    for batch, raw in zip(batches, raw_responses):
+        try:
+            parsed = orjson.loads(raw[raw.index('{'):raw.rindex('}') + 1])
+            for p in batch:
+                if p['candidate_id'] in parsed:
+                    analyses[p['candidate_id']] = str(parsed[p['candidate_id']])
+        except ValueError:
+            # Fall back to splitting a numbered list
+            parts = re.split(r'^\s*\d+\.\s*', raw, flags=re.MULTILINE)[1:]
+            for p, part in zip(batch, parts):
+                analyses[p['candidate_id']] = part.strip()
+    return analyses
+
+def log_action(action_type, details, user="local"):
+    """Appends an entry to the audit log through the shared buffered handler."""
+    _audit_logger.info("user:%s | %s | %s", user, action_type, details)
+
+def is_pure_search(query):
+    """True when the query is a plain lookup that doesn't need the LLM."""
+    return bool(_SEARCH_VERB_RE.match(query)) and not _NEEDS_LLM_RE.search(query)
+
+def render_result_list(results):
+    """Templated Markdown answer used instead of an LLM reply for pure searches."""
+    if not results:
+        return "No matching candidates found."
+    lines = []
+    for r in results:
+        skills = ", ".join(s['name'] for s in r.get('skills', [])[:5]) or "N/A"
+        lines.append(f"- **{r.get('name', 'Candidate')}** ({r.get('role_category', 'N/A')}) "
+                     f"- Skills: {skills} - Match: {r.get('search_score', 0):.0%}")
+    return "\n".join(lines)
+
 def mask_pii(value, reveal=False):
     """Masks email and phone numbers for privacy."""
     if not value or reveal:
@@ -112,13 +317,19 @@ def mask_pii(value, reveal=False):
         return f"{'*' * 3}@{parts[1]}"
     return "***-***-****"
 
+def prepare_for_display(profile):
+    """Precomputes the skill-tag HTML, masked contacts and LLM blurb for each result."""
+    skills = [s['name'] for s in profile.get('skills', [])][:8]
+    profile['_skill_html'] = "".join(f"<span class='skill-tag'>{s}</span>" for s in skills)
+    profile['_masked_email'] = mask_pii(profile.get('email', 'N/A'))
+    profile['_masked_phone'] = mask_pii(profile.get('phone', 'N/A'))
+    profile['_ai_blurb'] = format_candidate_for_ai(profile)
+    return profile
+
+@st.cache_data(show_spinner=False, max_entries=64)
 def extract_requirements_from_jd(text):
     """Simple keyword extraction from Job Description."""
-    keywords = [
-        'python', 'java', 'sql', 'aws', 'docker', 'kubernetes', 'react', 
-        'node', 'machine learning', 'nlp', 'pytorch', 'agile', 'scrum'
-    ]
-    found_skills = [k for k in keywords if k in text.lower()]
+    found_skills = list(dict.fromkeys(_JD_SKILL_RE.findall(text.lower())))
     return {
         'skills': found_skills,
         'search_query': ' '.join(found_skills) if found_skills else text[:100]
@@ -128,6 +339,12 @@ def extract_requirements_from_jd(text):
 def load_retriever():
     return get_retriever()
 
+@st.cache_data(show_spinner=False, max_entries=128, ttl=300)
+def cached_search(query, k, filters_key=()):
+    """Memoizes searches so UI-only reruns don't re-query the indexes."""
+    results = load_retriever().semantic_search(query, k=k, filters=dict(filters_key) or None)
+    return [prepare_for_display(p) for p in results]
+
 # --- Main Application ---
 
 def main():
@@ -136,11 +353,15 @@ def main():
     # Session State Init
     if 'revealed_pii' not in st.session_state:
         st.session_state.revealed_pii = set()
-    if 'ollama_online' not in st.session_state:
-        st.session_state.ollama_online = check_ollama_available()
+    if 'ai_analyses' not in st.session_state:
+        st.session_state.ai_analyses = {}
+    if 'last_results' not in st.session_state:
+        st.session_state.last_results = {}  # mode -> results of its last search
+    # Cached with a short TTL, so this only pings Ollama every few seconds
+    st.session_state.ollama_online = check_ollama_available()
 
     try:
-        retriever = load_retriever()
+        load_retriever()
     except Exception as e:
         st.error(f"System Error: {e}")
         st.stop()
@@ -161,9 +382,18 @@ def main():
     st.sidebar.subheader("Filters")
     role_filter = st.sidebar.selectbox("Role", ["All", "Engineering", "Sales", "Product", "Marketing"])
     min_exp = st.sidebar.slider("Min Experience", 0, 20, 0)
+    required_skills = st.sidebar.text_input("Required Skills", placeholder="e.g. python, docker")
+
+    st.sidebar.markdown("---")
+    st.sidebar.caption(f"AI Service: {'Online' if st.session_state.ollama_online else 'Offline'}")
+    if st.sidebar.button("Refresh AI Status"):
+        check_ollama_available.clear()
+        st.rerun()
+    st.sidebar.caption("Tip: start Ollama with `OLLAMA_NUM_PARALLEL=4` so batched AI analyses run concurrently.")
     
     # Logic Controller
     results = []
+    searched = False  # Set when this rerun ran a JD Match / AI Assistant search
     
     # MODE 1: Traditional Search
     if mode == "Traditional Search":
@@ -174,8 +404,12 @@ def main():
                 filters['role_category'] = role_filter
             if min_exp > 0:
                 filters['min_experience'] = min_exp
+            if required_skills.strip():
+                filters['required_skills'] = tuple(sorted(
+                    {s.strip().lower() for s in required_skills.split(",") if s.strip()}
+                ))
                 
-            results = retriever.semantic_search(query, k=10, filters=filters)
+            results = cached_search(query, 10, tuple(sorted(filters.items())))
 
     # MODE 2: JD Match
     elif mode == "JD Match":
@@ -189,11 +423,13 @@ def main():
                 
                 # AI Summary if available
                 if st.session_state.ollama_online:
-                    with st.spinner("Generating AI Summary..."):
-                        summary = chat_with_ollama(f"Summarize this role in 1 sentence: {jd_text[:500]}")
-                        st.info(f"AI Summary: {summary}")
+                    stream_chat_with_ollama(
+                        f"Summarize this role in 1 sentence: {jd_text[:500]}",
+                        st.empty(), prefix="**AI Summary:** "
+                    )
 
-                results = retriever.semantic_search(reqs['search_query'], k=15)
+                results = cached_search(reqs['search_query'], 15)
+                searched = True
 
     # MODE 3: AI Assistant
     elif mode == "AI Assistant":
@@ -204,20 +440,37 @@ def main():
             user_query = st.text_input("Ask the AI", placeholder="Find me candidates who know PyTorch...")
             if st.button("Send Query") and user_query:
                 # 1. Search first to get context
-                search_res = retriever.semantic_search(user_query, k=5)
+                search_res = cached_search(user_query, 5)
                 
                 # 2. Format context for LLM
-                context_str = "\n".join([f"- {r.get('name')}: {r.get('resume_snippet')[:200]}" for r in search_res])
+                context_str = "\n".join(
+                    f"{i}. {r['_ai_blurb']} | {(r.get('resume_snippet') or '')[:200]}"
+                    for i, r in enumerate(search_res, 1)
+                )
                 
-                # 3. Get LLM Response
-                with st.spinner("AI is analyzing candidates..."):
-                    ai_response = chat_with_ollama(user_query, context=context_str)
-                    st.markdown(f"**AI Response:**\n\n{ai_response}")
-                    results = search_res
+                # 3. Get LLM Response (skipped when retrieval already answers the query)
+                if is_pure_search(user_query):
+                    st.markdown(f"**Top Matches:**\n\n{render_result_list(search_res)}")
+                else:
+                    stream_chat_with_ollama(user_query, st.empty(), context=context_str, prefix="**AI Response:**\n\n")
+                results = search_res
+                searched = True
+
+    # JD Match and AI Assistant only search on their button's rerun; keep those
+    # results (even empty ones) so later reruns still render the latest search
+    if searched:
+        st.session_state.last_results[mode] = results
+    elif mode != "Traditional Search":
+        results = st.session_state.last_results.get(mode, [])
 
     # --- Results Rendering ---
     if results:
         st.markdown(f"### Found {len(results)} Candidates")
+        if st.session_state.ollama_online and st.button("Analyze All Shown"):
+            with st.spinner("AI is analyzing candidates..."):
+                st.session_state.ai_analyses.update(chat_with_ollama_batch(results))
+            log_action("AI_BATCH_ANALYSIS", f"{len(results)} candidates")
+
         for profile in results:
             cid = profile['candidate_id']
             score = profile.get('search_score', 0)
@@ -237,29 +490,38 @@ def main():
                 col1, col2 = st.columns([3, 1])
                 
                 with col1:
-                    st.markdown(f"<span class='match-badge {badge_class}'>{match_text}</span>", unsafe_allow_html=True)
-                    st.markdown(f"**Role:** {profile.get('role_category', 'N/A')}")
-                    st.markdown(f"**Experience:** {profile.get('experience_years', 0)} years")
-                    
-                    # Skills
-                    skills = [s['name'] for s in profile.get('skills', [])][:8]
-                    skill_html = "".join([f"<span class='skill-tag'>{s}</span>" for s in skills])
-                    st.markdown(f"<div style='margin-top:8px'>{skill_html}</div>", unsafe_allow_html=True)
+                    # Badge, details and skills go out as a single markdown element
+                    st.markdown(
+                        f"<span class='match-badge {badge_class}'>{match_text}</span>\n\n"
+                        f"**Role:** {profile.get('role_category', 'N/A')}\n\n"
+                        f"**Experience:** {profile.get('experience_years', 0)} years\n\n"
+                        f"<div style='margin-top:8px'>{profile['_skill_html']}</div>",
+                        unsafe_allow_html=True
+                    )
                     
                     st.caption(f"Snippet: ...{profile.get('resume_snippet', '')[:300]}...")
 
+                    analysis = st.session_state.ai_analyses.get(cid)
+                    if analysis:
+                        st.info(f"AI Analysis: {analysis}")
+
                 with col2:
                     # PII Handling
                     is_revealed = cid in st.session_state.revealed_pii
-                    email = profile.get('email', 'N/A')
-                    phone = profile.get('phone', 'N/A')
+                    if is_revealed:
+                        email = profile.get('email', 'N/A')
+                        phone = profile.get('phone', 'N/A')
+                    else:
+                        email = profile['_masked_email']
+                        phone = profile['_masked_phone']
                     
                     st.markdown("#### Contact")
-                    st.text(f"Email: {mask_pii(email, is_revealed)}")
-                    st.text(f"Phone: {mask_pii(phone, is_revealed)}")
+                    st.text(f"Email: {email}")
+                    st.text(f"Phone: {phone}")
                     
                     if not is_revealed:
                         if st.button("Reveal Contact", key=f"rev_{cid}"):
+                            log_action("REVEAL_PII", cid)
                             st.session_state.revealed_pii.add(cid)
                             st.rerun()
                     
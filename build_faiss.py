@@ -1,3 +1,4 @@
+import os
 import json
 import numpy as np
 import faiss
@@ -7,58 +8,94 @@ from pathlib import Path
 PARSED_DIR = Path("data/parsed")
 INDEX_DIR = Path("data/index")
 INDEX_DIR.mkdir(parents=True, exist_ok=True)
+INDEX_PATH = INDEX_DIR / "faiss.index"
+META_PATH = INDEX_DIR / "meta.json"
+QUANTIZED_INDEX_PATH = INDEX_DIR / "faiss_sq8.index"
+# Single (N, D) embedding matrix + row-aligned ids written by parse_resumes.py
+BUNDLE_PATH = PARSED_DIR / "all.npy"
+BUNDLE_IDS_PATH = PARSED_DIR / "ids.txt"
 
-def build_vector_index():
-    print("--- Building FAISS Vector Index ---")
-    embeddings = []
-    candidate_ids = []
+# HNSW graph parameters (neighbours per node, build-time search breadth)
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+# Set FAISS_INDEX_TYPE=ivf for an inverted-file index (cheaper to build at large N)
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "hnsw")
 
-    # Load all .npy files generated by parse_resumes.py
-    files = list(sorted(PARSED_DIR.glob("*.npy")))
-    
-    if not files:
-        print(" No embeddings found. Please run 'parse_resumes.py' first.")
-        return
+def read_saved_meta():
+    """meta.json of the saved indexes, or None if they can't be reused as built by INDEX_TYPE."""
+    try:
+        # meta.json is written last, so an older one means the last save was interrupted
+        if META_PATH.stat().st_mtime < INDEX_PATH.stat().st_mtime or not QUANTIZED_INDEX_PATH.exists():
+            return None
+        with open(META_PATH, 'r') as f:
+            meta = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not isinstance(meta, dict) or not isinstance(meta.get('candidate_ids'), list):
+        return None
+    # Indexes built as another FAISS_INDEX_TYPE (or before it was recorded) are rebuilt
+    if meta.get('index_type') != INDEX_TYPE:
+        return None
+    return meta
+
+def create_indexes(xb):
+    """Creates empty float (HNSW) and int8 indexes sized for normalized matrix xb."""
+    d = xb.shape[1]
+    print(f"Indexing vectors (Dimension: {d})...")
+    # Inner Product + Normalized = Cosine Similarity
+    if INDEX_TYPE == "ivf":
+        # ~4*sqrt(N) lists; queries only score the nprobe closest lists
+        nlist = max(1, min(int(4 * np.sqrt(xb.shape[0])), xb.shape[0]))
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(xb)
+    else:
+        # Graph-based ANN
+        index = faiss.IndexHNSWFlat(d, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+
+    # int8 scalar-quantized twin: 4x smaller, scored with SIMD int8 kernels
+    sq_index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    sq_index.train(xb)
+    return index, sq_index
+
+def save_indexes(index, sq_index, candidate_ids):
+    faiss.write_index(index, str(INDEX_PATH))
+    faiss.write_index(sq_index, str(QUANTIZED_INDEX_PATH))
+
+    # Save Metadata
+    with open(META_PATH, 'w') as f:
+        json.dump({"candidate_ids": candidate_ids, "index_type": INDEX_TYPE}, f, indent=2)
+
+    print(f" Successfully indexed {index.ntotal} candidates.")
 
-    print(f"Loading {len(files)} candidate embeddings...")
-    for npy_file in files:
-        try:
-            candidate_id = npy_file.stem
-            emb = np.load(npy_file).astype('float32')
-            
-            # Ensure 1D array for flattening
-            if emb.ndim > 1:
-                emb = emb.flatten()
-            
-            embeddings.append(emb)
-            candidate_ids.append(candidate_id)
-        except Exception as e:
-            print(f"Warning: Could not load {npy_file}: {e}")
+def build_from_bundle():
+    """Indexes the whole embedding bundle with one vectorized load."""
+    if read_saved_meta() is not None and INDEX_PATH.stat().st_mtime >= BUNDLE_PATH.stat().st_mtime:
+        print(" Index is up to date.")
+        return
 
-    if not embeddings:
-        print(" No valid embeddings loaded.")
+    candidate_ids = BUNDLE_IDS_PATH.read_text().splitlines()
+    # One cast from the memmap; the copy is needed because normalize_L2 works in place
+    xb = np.array(np.load(BUNDLE_PATH, mmap_mode='r'), dtype=np.float32)
+    if len(candidate_ids) != xb.shape[0]:
+        print(f" Bundle mismatch: {xb.shape[0]} vectors for {len(candidate_ids)} ids. Re-run 'parse_resumes.py'.")
         return
 
-    # Convert to matrix
-    xb = np.vstack(embeddings)
-    d = xb.shape[1]
-    
-    # Normalize vectors for Cosine Similarity
+    print(f"Loaded {len(candidate_ids)} candidate embeddings from bundle...")
     faiss.normalize_L2(xb)
-    
-    # Create and Populate Index
-    print(f"Indexing vectors (Dimension: {d})...")
-    index = faiss.IndexFlatIP(d) # Inner Product + Normalized = Cosine Similarity
+    index, sq_index = create_indexes(xb)
     index.add(xb)
-    
-    # Save to disk
-    faiss.write_index(index, str(INDEX_DIR / "faiss.index"))
-    
-    # Save Metadata
-    with open(INDEX_DIR / "meta.json", 'w') as f:
-        json.dump({"candidate_ids": candidate_ids}, f, indent=2)
-        
-    print(f" Successfully indexed {index.ntotal} candidates.")
+    sq_index.add(xb)
+    save_indexes(index, sq_index, candidate_ids)
+
+def build_vector_index():
+    print("--- Building FAISS Vector Index ---")
+
+    if not (BUNDLE_PATH.exists() and BUNDLE_IDS_PATH.exists()):
+        print(" No embeddings found. Please run 'parse_resumes.py' first.")
+        return
+    build_from_bundle()
 
 if __name__ == "__main__":
-    build_vector_index()
\ No newline at end of file
+    build_vector_index()
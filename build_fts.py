@@ -1,63 +1,127 @@
 import sqlite3
-import json
+import orjson
 from pathlib import Path
+from concurrency import map_in_processes
 
 PARSED_DIR = Path("data/parsed")
 INDEX_DIR = Path("data/index")
 INDEX_DIR.mkdir(parents=True, exist_ok=True)
 DB_PATH = INDEX_DIR / "meta.sqlite"
+INSERT_BATCH_SIZE = 10000  # Rows per executemany flush; bounds memory on large corpora
+PARALLEL_LOAD_MIN_FILES = 256  # Profile JSON parses quickly; only large batches gain from a pool
+
+def load_row(json_file):
+    """Parses one profile into a `profiles` row tuple, or None if it can't be read."""
+    try:
+        p = orjson.loads(json_file.read_bytes())
+
+        # Flatten skills list into a string "Python SQL Docker"; malformed entries are
+        # left out rather than dropping the row, which the KPI counts still need
+        skill_list = p.get('skills')
+        skills = " ".join(
+            s['name'] for s in skill_list if isinstance(s, dict) and isinstance(s.get('name'), str)
+        ) if isinstance(skill_list, list) else ""
+
+        return (
+            p.get('candidate_id'),
+            p.get('stage', 'Uploaded'),
+            p.get('parsed_date'),
+            p.get('role_category'),
+            p.get('name', ''),
+            skills,
+            p.get('resume_snippet', ''),
+            p.get('email', ''),
+            p.get('phone', ''),
+            # Source-effectiveness key as the KPI JSON scan computes it: only a
+            # missing role_category becomes 'Unknown'
+            p.get('role_category', 'Unknown')
+        )
+    except Exception as e:
+        print(f"Skipping {json_file}: {e}")
+        return None
+
+def load_rows(files):
+    """`profiles` rows for files, skipping those that can't be read."""
+    rows = map_in_processes(load_row, files, PARALLEL_LOAD_MIN_FILES, chunksize=64)
+    return [row for row in rows if row is not None]
 
 def build_text_index():
     print("--- Building SQLite Full-Text Search ---")
     
-    # Connect to local database
-    conn = sqlite3.connect(DB_PATH)
+    # Connect to local database; transactions are managed explicitly below
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
     cursor = conn.cursor()
-    
-    # Create Virtual Table for fast text searching
+    files = list(sorted(PARSED_DIR.glob("*.json")))
+
+    # journal_mode can't change inside a transaction
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    # One transaction from the DROPs to the FTS rebuild: readers keep seeing the
+    # previous tables until the new ones are complete
+    cursor.execute("BEGIN")
+
+    # Plain table holds every column once: KPI queries use SQL aggregates on it
+    # instead of deserializing every profile, and it is the FTS content source
     cursor.execute("DROP TABLE IF EXISTS profiles_fts")
+    cursor.execute("DROP TABLE IF EXISTS profiles")
+    cursor.execute("""
+        CREATE TABLE profiles(
+            id INTEGER PRIMARY KEY,
+            candidate_id TEXT,
+            stage TEXT,
+            parsed_date TEXT,
+            role_category TEXT,
+            name TEXT,
+            skills TEXT,
+            resume_snippet TEXT,
+            email TEXT,
+            phone TEXT,
+            source_key TEXT
+        )
+    """)
+    cursor.execute("CREATE INDEX idx_stage ON profiles(stage)")
+    # Every .json file counts toward the candidate pool, readable or not
+    cursor.execute("DROP TABLE IF EXISTS build_info")
+    cursor.execute("CREATE TABLE build_info(json_files INTEGER)")
+    cursor.execute("INSERT INTO build_info VALUES (?)", (len(files),))
+
+    # External-content FTS index: text is read back from `profiles`, not stored twice.
+    # candidate_id is only returned, never matched (its tokens duplicate `name`)
     cursor.execute("""
         CREATE VIRTUAL TABLE profiles_fts USING fts5(
-            candidate_id,
+            candidate_id UNINDEXED,
             name,
             role_category,
             skills,
             resume_snippet,
             email,
-            phone
+            phone,
+            content='profiles',
+            content_rowid='id'
         )
     """)
-    
-    files = list(sorted(PARSED_DIR.glob("*.json")))
+
     if not files:
+        cursor.execute("COMMIT")
+        conn.close()
         print(" No JSON profiles found.")
         return
 
+    # Bulk load: the same transaction and one prepared statement for every row
     count = 0
-    for json_file in files:
-        try:
-            with open(json_file, 'r') as f:
-                p = json.load(f)
-            
-            # Flatten skills list into a string "Python SQL Docker"
-            skills = " ".join([s['name'] for s in p.get('skills', [])])
-            
-            cursor.execute("""
-                INSERT INTO profiles_fts VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                p.get('candidate_id'),
-                p.get('name', ''),
-                p.get('role_category', ''),
-                skills,
-                p.get('resume_snippet', ''),
-                p.get('email', ''),
-                p.get('phone', '')
-            ))
-            count += 1
-        except Exception as e:
-            print(f"Skipping {json_file}: {e}")
-            
-    conn.commit()
+    for start in range(0, len(files), INSERT_BATCH_SIZE):
+        rows = load_rows(files[start:start + INSERT_BATCH_SIZE])
+        cursor.executemany("""
+            INSERT INTO profiles(
+                candidate_id, stage, parsed_date, role_category,
+                name, skills, resume_snippet, email, phone, source_key
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        count += len(rows)
+    # Build the whole FTS index from the content table in one pass
+    cursor.execute("INSERT INTO profiles_fts(profiles_fts) VALUES('rebuild')")
+    cursor.execute("COMMIT")
     conn.close()
     print(f" Indexed {count} profiles for keyword search.")
 
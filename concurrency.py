@@ -0,0 +1,34 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+def map_in_processes(fn, items, min_items, chunksize=1):
+    """Maps fn over items across worker processes, or in-process below min_items.
+
+    Pool start-up costs more than it saves on small inputs, so each caller picks
+    a threshold to suit its per-item cost. fn must be a module-level function.
+    """
+    if len(items) < min_items:
+        return list(map(fn, items))
+    with ProcessPoolExecutor() as ex:
+        return list(ex.map(fn, items, chunksize=chunksize))
+
+class Debouncer:
+    """Calls `callback` once, `delay` seconds after the first schedule() of a burst."""
+
+    def __init__(self, delay, callback):
+        self.delay = delay
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def schedule(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self._fire)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _fire(self):
+        with self._lock:
+            self._timer = None
+        self.callback()
@@ -7,6 +7,22 @@ from pathlib import Path
 # CHANGED: Use a relative path so it works on any machine
 BASE_PATH = Path("data/resumes")
 
+def count_resume_files(folder):
+    """Counts .docx/.pdf/.doc files in one scandir pass; also returns the entry names."""
+    docx = pdf = doc = 0
+    names = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            names.append(entry.name)
+            name = entry.name.lower()
+            if name.endswith('.docx'):
+                docx += 1
+            elif name.endswith('.pdf'):
+                pdf += 1
+            elif name.endswith('.doc'):
+                doc += 1
+    return docx, pdf, doc, names
+
 print(f"\nInspecting Directory: {BASE_PATH}\n")
 
 if not BASE_PATH.exists():
@@ -18,6 +34,13 @@ print("=" * 60)
 print("DIRECTORY STRUCTURE")
 print("=" * 60)
 
+# Folders shown in the structure report but left out of the summary totals
+EXCLUDED_ROLES = ['Active Associates', 'Archive']
+
+# (role, candidate, docx, pdf, doc) per candidate folder, collected once and
+# reused for the summary so the tree is only walked a single time
+records = []
+
 # List all top-level folders (Roles)
 for item in sorted(BASE_PATH.iterdir()):
     if item.is_dir() and not item.name.startswith('.'):
@@ -27,27 +50,27 @@ for item in sorted(BASE_PATH.iterdir()):
         subfolders = [x for x in item.iterdir() if x.is_dir()]
         print(f"   Subdirectories: {len(subfolders)}")
         
-        # List first 5 subfolders to keep output clean
-        for subfolder in subfolders[:5]:
-            print(f"   -- {subfolder.name}")
-            
+        for i, subfolder in enumerate(subfolders):
             # Check for resume files
-            docx_files = list(subfolder.glob("*.docx"))
-            pdf_files = list(subfolder.glob("*.pdf"))
-            doc_files = list(subfolder.glob("*.doc"))
+            docx_count, pdf_count, doc_count, names = count_resume_files(subfolder)
+            records.append((item.name, subfolder.name, docx_count, pdf_count, doc_count))
+
+            # List first 5 subfolders to keep output clean
+            if i >= 5:
+                continue
+            print(f"   -- {subfolder.name}")
             
-            if docx_files:
-                print(f"      Found {len(docx_files)} .docx file(s)")
-            if pdf_files:
-                print(f"      Found {len(pdf_files)} .pdf file(s)")
-            if doc_files:
-                print(f"      Found {len(doc_files)} .doc file(s)")
+            if docx_count:
+                print(f"      Found {docx_count} .docx file(s)")
+            if pdf_count:
+                print(f"      Found {pdf_count} .pdf file(s)")
+            if doc_count:
+                print(f"      Found {doc_count} .doc file(s)")
                 
-            if not (docx_files or pdf_files or doc_files):
+            if not (docx_count or pdf_count or doc_count):
                 # Check if folder is empty or contains other files
-                files = list(subfolder.glob("*"))
-                if files:
-                    print(f"      [!] No resumes, but found: {[f.name for f in files[:3]]}")
+                if names:
+                    print(f"      [!] No resumes, but found: {names[:3]}")
                 else:
                     print(f"      [!] Empty folder")
         
@@ -58,25 +81,10 @@ print("\n" + "=" * 60)
 print("SUMMARY")
 print("=" * 60)
 
-total_candidates = 0
-total_resumes = 0
-
-for role_folder in BASE_PATH.iterdir():
-    if not role_folder.is_dir() or role_folder.name.startswith('.'):
-        continue
-    
-    # Skip specific internal folders if necessary
-    if role_folder.name in ['Active Associates', 'Archive']:
-        continue
-    
-    subfolders = [x for x in role_folder.iterdir() if x.is_dir()]
-    total_candidates += len(subfolders)
-    
-    for candidate_folder in subfolders:
-        docx = len(list(candidate_folder.glob("*.docx")))
-        pdf = len(list(candidate_folder.glob("*.pdf")))
-        doc = len(list(candidate_folder.glob("*.doc")))
-        total_resumes += (docx + pdf + doc)
+# Skip specific internal folders if necessary
+counted = [r for r in records if r[0] not in EXCLUDED_ROLES]
+total_candidates = len(counted)
+total_resumes = sum(docx + pdf + doc for *_, docx, pdf, doc in counted)
 
 print(f"Total Candidate Profiles: {total_candidates}")
-print(f"Total Resume Files Found: {total_resumes}")
\ No newline at end of file
+print(f"Total Resume Files Found: {total_resumes}")
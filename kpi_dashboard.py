@@ -1,26 +1,100 @@
-import json
+import atexit
+import os
+import orjson
+import pickle
+import sqlite3
+import threading
+import time
+import numpy as np
+from array import array
 from pathlib import Path
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import Counter
+from concurrency import Debouncer, map_in_processes
 
 # --- Configuration ---
 PARSED_DIR = Path("data/parsed")
 METRICS_DIR = Path("data/metrics")
 METRICS_DIR.mkdir(parents=True, exist_ok=True)
 METRICS_FILE = METRICS_DIR / "kpi_metrics.json"
+PROFILE_CACHE_FILE = METRICS_DIR / "profile_cache_v2.pkl"  # Renamed when the cached field tuple changes
+DB_PATH = Path("data/index/meta.sqlite")  # 'profiles' table written by build_fts.py
+PARALLEL_LOAD_MIN_FILES = 256  # Only a cold cache over a large corpus is worth a process pool
+# Funnel stages in order; a candidate counts toward every stage up to its own
+FUNNEL_KEYS = ('uploaded', 'reviewed', 'interviewed', 'offered', 'hired')
+STAGE_LEVEL = {'Uploaded': 0, 'Reviewed': 1, 'Screening': 1, 'Interview': 2, 'Offer': 3, 'Hired': 4}
+METRICS_MAX_AGE_SECONDS = 60  # Dashboard reuses a profile scan younger than this
+SAVE_DEBOUNCE_SECONDS = 2  # Transitions/rejections within this window share one write
+HIRING_TRENDS_DAYS = 30  # Window precomputed by the profile scan for get_hiring_trends
+
+# Process-wide read connection; WAL lets request threads read concurrently
+_kpi_conn = None
+_kpi_conn_inode = None
+_kpi_conn_lock = threading.Lock()
+
+def get_kpi_connection():
+    """Returns the shared KPI connection, reopening it if build_fts.py replaced the file."""
+    global _kpi_conn, _kpi_conn_inode
+    inode = DB_PATH.stat().st_ino
+    with _kpi_conn_lock:
+        if _kpi_conn is None or _kpi_conn_inode != inode:
+            if _kpi_conn is not None:
+                _kpi_conn.close()
+            conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA mmap_size=268435456")
+            _kpi_conn, _kpi_conn_inode = conn, inode
+        return _kpi_conn
+
+def aggregate_stage_kernel(levels, presented, timestamps, now_ts):
+    """Funnel counts and time-to-present/hire totals over per-candidate arrays.
+
+    levels: int8 funnel level per candidate, presented: bool (past 'Uploaded'/'New'),
+    timestamps: float64 unix parse time, NaN when missing.
+    """
+    # Level L counts toward every funnel step 0..L, i.e. a reversed cumulative sum
+    funnel = np.bincount(levels, minlength=len(FUNNEL_KEYS))[::-1].cumsum()[::-1]
+
+    dated = ~np.isnan(timestamps)
+    hours = (now_ts - timestamps[dated & presented]) / 3600
+    days = np.floor((now_ts - timestamps[dated & (levels == STAGE_LEVEL['Hired'])]) / 86400)
+    ttp = {'sum': float(hours.sum()), 'count': int(hours.size)}
+    tth = {'sum': int(days.sum()), 'count': int(days.size)}
+    return [int(c) for c in funnel], ttp, tth
+
+def _read_kpi_fields(json_file):
+    """Loads one profile and keeps only the fields the KPI aggregation needs."""
+    try:
+        profile = orjson.loads(json_file.read_bytes())
+    except:
+        return None
+    return (
+        profile.get('stage', 'Uploaded'),
+        profile.get('parsed_date'),
+        profile.get('role_category'),
+        # Source key: only a missing role_category counts as 'Unknown'; None and '' stay as-is
+        profile.get('role_category', 'Unknown')
+    )
 
 class KPIDashboard:
     def __init__(self):
         self.metrics_file = METRICS_FILE
+        self._scan = None  # Pool size, roles and trends from the last profile scan
+        self._scanned_at = None  # time.monotonic() of the last full recalculation
+        self._profile_cache = self._load_profile_cache()  # file name -> (mtime_ns, kpi fields)
+        self._pool_cache = (0, 0)  # (PARSED_DIR mtime_ns, .json count)
+        self._save_lock = threading.RLock()
+        self._dirty = False
+        self._debouncer = Debouncer(SAVE_DEBOUNCE_SECONDS, self.flush)
         self.load_metrics()
+        atexit.register(self.flush)
     
     def load_metrics(self):
         """Load existing metrics from disk or initialize defaults."""
         if self.metrics_file.exists():
             try:
-                with open(self.metrics_file, 'r') as f:
-                    self.metrics = json.load(f)
-            except json.JSONDecodeError:
+                self.metrics = orjson.loads(self.metrics_file.read_bytes())
+            except orjson.JSONDecodeError:
                 self._init_default_metrics()
         else:
             self._init_default_metrics()
@@ -28,103 +102,200 @@ class KPIDashboard:
     def _init_default_metrics(self):
         """Initialize empty metrics structure."""
         self.metrics = {
-            'candidates_by_stage': defaultdict(int),
+            'candidates_by_stage': {},
             'stage_transitions': [],
-            'time_to_present': [],
-            'time_to_hire': [],
+            'time_to_present': {'sum': 0.0, 'count': 0},
+            'time_to_hire': {'sum': 0, 'count': 0},
             'conversions': {'uploaded': 0, 'reviewed': 0, 'interviewed': 0, 'offered': 0, 'hired': 0},
-            'rejections_by_reason': defaultdict(int),
-            'candidates_by_source': defaultdict(int),
+            'rejections_by_reason': {},
+            'candidates_by_source': {},
             'last_updated': datetime.now().isoformat()
         }
     
     def save_metrics(self):
         """Save current metrics to disk."""
-        self.metrics['last_updated'] = datetime.now().isoformat()
-        # Convert defaultdicts to regular dicts for JSON serialization
-        serializable_metrics = self.metrics.copy()
-        if isinstance(serializable_metrics.get('rejections_by_reason'), defaultdict):
-            serializable_metrics['rejections_by_reason'] = dict(serializable_metrics['rejections_by_reason'])
-        if isinstance(serializable_metrics.get('candidates_by_source'), defaultdict):
-            serializable_metrics['candidates_by_source'] = dict(serializable_metrics['candidates_by_source'])
-            
-        with open(self.metrics_file, 'w') as f:
-            json.dump(serializable_metrics, f, indent=2)
-    
+        with self._save_lock:
+            # A full save also covers any pending debounced changes
+            self._dirty = False
+            self.metrics['last_updated'] = datetime.now().isoformat()
+            # Counters can hold non-str keys (e.g. a null stage); stringify them as json.dumps did
+            self.metrics_file.write_bytes(orjson.dumps(self.metrics, option=orjson.OPT_NON_STR_KEYS))
+
+    def _mark_dirty(self):
+        """Schedules a save instead of rewriting the metrics file on every event."""
+        with self._save_lock:
+            self._dirty = True
+        self._debouncer.schedule()
+
+    def flush(self):
+        """Writes pending transitions/rejections, if any."""
+        with self._save_lock:
+            if self._dirty:
+                self.save_metrics()
+
+    def _load_profile_cache(self):
+        try:
+            with open(PROFILE_CACHE_FILE, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            return {}
+
+    def load_profile_fields(self, files):
+        """KPI fields for every profile, re-parsing only files whose mtime changed."""
+        fresh = {}
+        stale = []
+        for json_file in files:
+            try:
+                mtime = json_file.stat().st_mtime_ns
+            except OSError:
+                continue
+            hit = self._profile_cache.get(json_file.name)
+            if hit and hit[0] == mtime:
+                fresh[json_file.name] = hit
+            else:
+                stale.append((json_file, mtime))
+
+        stale_files = [json_file for json_file, _ in stale]
+        loaded = map_in_processes(_read_kpi_fields, stale_files, PARALLEL_LOAD_MIN_FILES, chunksize=64)
+        for (json_file, mtime), fields in zip(stale, loaded):
+            fresh[json_file.name] = (mtime, fields)
+
+        # Rebuilding from `fresh` also drops entries for deleted profiles
+        changed = bool(stale) or len(fresh) != len(self._profile_cache)
+        self._profile_cache = fresh
+        if changed:
+            with open(PROFILE_CACHE_FILE, 'wb') as f:
+                pickle.dump(fresh, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return [fields for _, fields in fresh.values()]
+
+    def _open_kpi_db(self):
+        """Shared connection to the KPI table from build_fts.py, or None if missing or stale."""
+        try:
+            # In WAL mode recent writes may only have touched the -wal file
+            wal_path = DB_PATH.with_name(DB_PATH.name + "-wal")
+            db_mtime = max(p.stat().st_mtime for p in (DB_PATH, wal_path) if p.exists())
+            if db_mtime < PARSED_DIR.stat().st_mtime:
+                return None
+            conn = get_kpi_connection()
+        except (OSError, ValueError, sqlite3.Error):
+            return None
+        # build_info only exists in databases with the current profiles schema
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='build_info'").fetchone():
+            return None
+        return conn
+
+    def _query_kpi_db(self, sql, params=()):
+        """Runs a KPI query against SQLite; None means fall back to scanning JSON."""
+        conn = self._open_kpi_db()
+        if conn is None:
+            return None
+        return conn.execute(sql, params).fetchall()
+
     def calculate_metrics_from_profiles(self):
         """Re-scan all profiles to rebuild aggregate metrics."""
-        self.metrics['candidates_by_stage'] = defaultdict(int)
-        self.metrics['conversions'] = {'uploaded': 0, 'reviewed': 0, 'interviewed': 0, 'offered': 0, 'hired': 0}
-        self.metrics['candidates_by_source'] = defaultdict(int)
-        
-        time_to_present_list = []
-        time_to_hire_list = []
+        # Raw values collected per row and histogrammed once by Counter (in C)
+        stages = []
+        sources = []
+
+        # Struct-of-arrays inputs for the vectorized funnel/time aggregation; typed
+        # arrays store raw machine values and hand their buffer to NumPy without copying
+        levels = array('b')
+        presented = array('b')
+        timestamps = array('d')
+
+        # Prefer the SQLite columns; fall back to the (cached) JSON profiles
+        rows = self._query_kpi_db("SELECT stage, parsed_date, role_category, source_key FROM profiles")
+        if rows is not None:
+            pool_size = self._query_kpi_db("SELECT json_files FROM build_info")[0][0]
+        else:
+            files = list(PARSED_DIR.glob("*.json"))
+            pool_size = len(files)
+            rows = self.load_profile_fields(files)
+
+        # Accumulators for the other dashboard getters, filled in the same pass
+        role_categories = set()
+        date_keys = []
+        # One clock read per scan; ISO strings compare chronologically, so trends
+        # can bucket on the raw string instead of re-formatting datetimes
+        now = datetime.now()
+        now_ts = now.timestamp()
+        cutoff_iso = (now - timedelta(days=HIRING_TRENDS_DAYS)).isoformat()
         
         # Scan every profile in the parsed directory
-        for json_file in PARSED_DIR.glob("*.json"):
-            try:
-                with open(json_file, 'r') as f:
-                    profile = json.load(f)
-            except:
+        for fields in rows:
+            if fields is None:
                 continue
 
-            stage = profile.get('stage', 'Uploaded')
-            self.metrics['candidates_by_stage'][stage] += 1
+            stage, parsed_date, role_category, source = fields
+            stages.append(stage)
             
             # --- Funnel Logic (Cumulative) ---
-            # Every candidate counts as 'Uploaded'
-            self.metrics['conversions']['uploaded'] += 1
-            
-            if stage in ['Reviewed', 'Screening', 'Interview', 'Offer', 'Hired']:
-                self.metrics['conversions']['reviewed'] += 1
-            
-            if stage in ['Interview', 'Offer', 'Hired']:
-                self.metrics['conversions']['interviewed'] += 1
-            
-            if stage in ['Offer', 'Hired']:
-                self.metrics['conversions']['offered'] += 1
-            
-            if stage == 'Hired':
-                self.metrics['conversions']['hired'] += 1
+            # Unknown stages stay at the 'Uploaded' level
+            levels.append(STAGE_LEVEL.get(stage, 0))
+            # Time to Present counts candidates moved past upload (reviewed/interviewed)
+            presented.append(stage not in ('Uploaded', 'New'))
 
             # --- Time Calculations ---
-            parsed_date = profile.get('parsed_date')
+            ts = np.nan
             if parsed_date:
                 try:
-                    parsed_dt = datetime.fromisoformat(parsed_date)
-                    now = datetime.now()
-                    
-                    # Time to Present (Time from upload to being reviewed/interviewed)
-                    if stage not in ['Uploaded', 'New']:
-                        hours = (now - parsed_dt).total_seconds() / 3600
-                        time_to_present_list.append(hours)
-
-                    # Time to Hire
-                    if stage == 'Hired':
-                        days = (now - parsed_dt).days
-                        time_to_hire_list.append(days)
+                    ts = datetime.fromisoformat(parsed_date).timestamp()
+                    if parsed_date >= cutoff_iso:
+                        date_keys.append(parsed_date[:10])
                 except ValueError:
                     pass
+            timestamps.append(ts)
 
             # --- Source Effectiveness ---
-            role_category = profile.get('role_category', 'Unknown')
-            self.metrics['candidates_by_source'][role_category] += 1
+            sources.append(source)
+            if role_category:
+                role_categories.add(role_category)
 
-        self.metrics['time_to_present'] = time_to_present_list
-        self.metrics['time_to_hire'] = time_to_hire_list
+        self._scan = {
+            'pool_size': pool_size,
+            'active_vacancies': len(role_categories),
+            'hiring_trends': self._format_trends(Counter(date_keys))
+        }
+        self.metrics['candidates_by_stage'] = dict(Counter(stages))
+        self.metrics['candidates_by_source'] = dict(Counter(sources))
+        # Running totals keep the mean O(1) and the saved metrics constant-size
+        funnel, ttp, tth = aggregate_stage_kernel(
+            np.frombuffer(levels, dtype=np.int8),
+            np.frombuffer(presented, dtype=np.int8).view(bool),
+            np.frombuffer(timestamps, dtype=np.float64),
+            now_ts
+        )
+        self.metrics['conversions'] = dict(zip(FUNNEL_KEYS, funnel))
+        self.metrics['time_to_present'] = ttp
+        self.metrics['time_to_hire'] = tth
+        self._scanned_at = time.monotonic()
         self.save_metrics()
+
+    def _is_fresh(self, max_age_s=METRICS_MAX_AGE_SECONDS):
+        return self._scanned_at is not None and time.monotonic() - self._scanned_at < max_age_s
+
+    def refresh_if_stale(self, max_age_s=METRICS_MAX_AGE_SECONDS):
+        """Recalculates metrics only if this process hasn't done so recently."""
+        if not self._is_fresh(max_age_s):
+            self.calculate_metrics_from_profiles()
+
+    def _fresh_scan(self):
+        """The last profile scan while it is recent enough to reuse, else None."""
+        return self._scan if self._is_fresh() else None
     
-    def get_time_to_present(self):
-        times = self.metrics.get('time_to_present', [])
-        if times:
-            return round(sum(times) / len(times), 1)
+    @staticmethod
+    def _running_mean(stat):
+        if isinstance(stat, list):  # Metrics files saved before running totals
+            stat = {'sum': sum(stat), 'count': len(stat)}
+        if stat and stat.get('count'):
+            return round(stat['sum'] / stat['count'], 1)
         return 0
+
+    def get_time_to_present(self):
+        return self._running_mean(self.metrics.get('time_to_present'))
     
     def get_time_to_hire(self):
-        times = self.metrics.get('time_to_hire', [])
-        if times:
-            return round(sum(times) / len(times), 1)
-        return 0
+        return self._running_mean(self.metrics.get('time_to_hire'))
     
     def get_conversion_rate(self):
         conversions = self.metrics.get('conversions', {})
@@ -143,17 +314,34 @@ class KPIDashboard:
         return 1.0
     
     def get_candidate_pool_size(self):
-        return len(list(PARSED_DIR.glob("*.json")))
+        scan = self._fresh_scan()
+        if scan is not None:
+            return scan['pool_size']
+        rows = self._query_kpi_db("SELECT json_files FROM build_info")
+        if rows is not None:
+            return rows[0][0]
+        # Adding/removing profiles bumps the directory mtime, so the count is reusable until then
+        mtime = os.stat(PARSED_DIR).st_mtime_ns
+        if mtime != self._pool_cache[0]:
+            with os.scandir(PARSED_DIR) as entries:
+                count = sum(1 for e in entries if e.name.endswith('.json'))
+            self._pool_cache = (mtime, count)
+        return self._pool_cache[1]
     
     def get_active_vacancies(self):
         # Count unique roles from profiles as a proxy for vacancies
+        scan = self._fresh_scan()
+        if scan is not None:
+            return scan['active_vacancies']
+        rows = self._query_kpi_db("SELECT COUNT(DISTINCT role_category) FROM profiles WHERE role_category != ''")
+        if rows is not None:
+            return rows[0][0]
         role_categories = set()
         for json_file in PARSED_DIR.glob("*.json"):
             try:
-                with open(json_file, 'r') as f:
-                    profile = json.load(f)
-                    if profile.get('role_category'):
-                        role_categories.add(profile['role_category'])
+                profile = orjson.loads(json_file.read_bytes())
+                if profile.get('role_category'):
+                    role_categories.add(profile['role_category'])
             except:
                 continue
         return len(role_categories)
@@ -177,23 +365,35 @@ class KPIDashboard:
     def get_source_effectiveness(self):
         return dict(self.metrics.get('candidates_by_source', {}))
     
-    def get_hiring_trends(self, days=30):
-        date_counts = defaultdict(int)
-        cutoff_date = datetime.now() - timedelta(days=days)
+    def get_hiring_trends(self, days=HIRING_TRENDS_DAYS):
+        scan = self._fresh_scan()
+        if scan is not None and days == HIRING_TRENDS_DAYS:
+            return scan['hiring_trends']
+
+        date_counts = Counter()
+        cutoff_iso = (datetime.now() - timedelta(days=days)).isoformat()
+
+        # ISO-8601 strings sort chronologically, so SQLite can filter and bucket them
+        rows = self._query_kpi_db(
+            "SELECT substr(parsed_date, 1, 10), COUNT(*) FROM profiles WHERE parsed_date >= ? GROUP BY 1",
+            (cutoff_iso,)
+        )
+        if rows is not None:
+            return self._format_trends(dict(rows))
         
         for json_file in PARSED_DIR.glob("*.json"):
             try:
-                with open(json_file, 'r') as f:
-                    profile = json.load(f)
+                profile = orjson.loads(json_file.read_bytes())
                 parsed_date = profile.get('parsed_date')
-                if parsed_date:
-                    parsed_dt = datetime.fromisoformat(parsed_date)
-                    if parsed_dt >= cutoff_date:
-                        date_key = parsed_dt.strftime('%Y-%m-%d')
-                        date_counts[date_key] += 1
+                if parsed_date and parsed_date >= cutoff_iso:
+                    date_counts[parsed_date[:10]] += 1
             except:
                 continue
                 
+        return self._format_trends(date_counts)
+
+    @staticmethod
+    def _format_trends(date_counts):
         sorted_dates = sorted(date_counts.items())
         return {
             'dates': [d[0] for d in sorted_dates], 
@@ -217,17 +417,18 @@ class KPIDashboard:
         if 'stage_transitions' not in self.metrics:
             self.metrics['stage_transitions'] = []
         self.metrics['stage_transitions'].append(transition)
-        self.save_metrics()
+        self._mark_dirty()
     
     def record_rejection(self, candidate_id, reason):
-        if 'rejections_by_reason' not in self.metrics:
-            self.metrics['rejections_by_reason'] = defaultdict(int)
-        self.metrics['rejections_by_reason'][reason] += 1
-        self.save_metrics()
+        # Plain dict (also what load_metrics returns), so count via get()
+        rejections = self.metrics.setdefault('rejections_by_reason', {})
+        rejections[reason] = rejections.get(reason, 0) + 1
+        self._mark_dirty()
     
     def get_dashboard_summary(self):
         """Aggregate all metrics into a single dictionary for the frontend."""
-        self.calculate_metrics_from_profiles()
+        # One directory pass feeds every getter below; reruns within a minute reuse it
+        self.refresh_if_stale()
         return {
             'time_to_present': self.get_time_to_present(),
             'time_to_hire': self.get_time_to_hire(),
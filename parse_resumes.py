@@ -1,21 +1,41 @@
-import sys
 import os
-import json
+import orjson
 import re
 import pickle
 from pathlib import Path
-from datetime import datetime
 import numpy as np
+from scipy import sparse
 import PyPDF2
+import pypdfium2 as pdfium
 from docx import Document
+from concurrency import map_in_processes
 
 # --- Configuration ---
 BASE_PATH = Path("data/resumes")
 PARSED_DIR = Path("data/parsed")
-PARSED_DIR.mkdir(parents=True, exist_ok=True)
 
 # Set to False if you want to use the heavier, smarter AI model (requires internet to download model first time)
 USE_SIMPLE_EMBEDDINGS = True 
+# Dynamic int8 quantization for the SentenceTransformer path (slightly lower embedding fidelity)
+QUANTIZE_SENTENCE_MODEL = True
+RESUME_SUFFIXES = {'.pdf', '.docx', '.txt'}  # Matched during the single directory walk
+PARALLEL_PARSE_MIN_FILES = 16  # PDF/DOCX extraction is slow per file, so a pool pays off early
+
+# Patterns compiled once at import instead of looked up in re's cache per resume
+EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+PHONE_RES = [
+    re.compile(r'\+?1?\s*\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}'),
+    re.compile(r'\d{3}[-.\s]\d{3}[-.\s]\d{4}')
+]
+LINKEDIN_RE = re.compile(r'linkedin\.com/in/[\w-]+', re.IGNORECASE)
+# Patterns like "5+ years", "10 years experience" as one alternation: a single scan per resume
+EXPERIENCE_RE = re.compile(r'(\d+)\+?\s*years?|experience\s*:\s*(\d+)')
+# (keyword, display name) pairs; add more keywords as needed
+SKILL_KEYWORDS = tuple((k, k.title()) for k in (
+    'python', 'java', 'javascript', 'c++', 'sql', 'aws', 'azure', 'docker', 
+    'kubernetes', 'react', 'node', 'pytorch', 'tensorflow', 'scikit-learn',
+    'agile', 'scrum', 'project management', 'communication', 'leadership'
+))
 
 class EnhancedLocalResumeParser:
     def __init__(self):
@@ -29,26 +49,27 @@ class EnhancedLocalResumeParser:
         if USE_SIMPLE_EMBEDDINGS:
             print("Loading TF-IDF Vectorizer...")
             from sklearn.feature_extraction.text import TfidfVectorizer
-            self.vectorizer = TfidfVectorizer(max_features=384, stop_words='english')
+            self.vectorizer = TfidfVectorizer(max_features=384, stop_words='english', dtype=np.float32)
             self.model = None
         else:
             print("Loading SentenceTransformer (Deep Learning)...")
             os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+            import torch
             from sentence_transformers import SentenceTransformer
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
+            # Dynamically quantized Linear layers only run on CPU
+            self.model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu' if QUANTIZE_SENTENCE_MODEL else None)
+            if QUANTIZE_SENTENCE_MODEL:
+                # int8 weights for the Linear layers: less memory traffic per matmul
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
             self.vectorizer = None
     
-    def extract_text(self, filepath):
+    @staticmethod
+    def extract_text(filepath):
         """Dispatches to specific extractors based on file extension."""
         suffix = filepath.suffix.lower()
         try:
             if suffix == '.pdf':
-                text = ""
-                with open(filepath, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    for page in reader.pages:
-                        text += page.extract_text() + "\n"
-                return text
+                return EnhancedLocalResumeParser.extract_pdf_text(filepath)
             elif suffix == '.docx':
                 doc = Document(filepath)
                 return "\n".join([para.text for para in doc.paragraphs])
@@ -61,106 +82,111 @@ class EnhancedLocalResumeParser:
             print(f"Error reading {filepath.name}: {e}")
             return ""
     
-    def extract_contact_info(self, text):
+    @staticmethod
+    def extract_pdf_text(filepath):
+        """PDF text via PDFium (native, much faster); PyPDF2 covers files it rejects."""
+        # Collect pages and join once; += would recopy the text per page
+        try:
+            pdf = pdfium.PdfDocument(str(filepath))
+            try:
+                pages = [page.get_textpage().get_text_range() for page in pdf]
+            finally:
+                pdf.close()
+        except pdfium.PdfiumError:
+            with open(filepath, 'rb') as f:
+                reader = PyPDF2.PdfReader(f)
+                pages = [page.extract_text() or "" for page in reader.pages]
+        return "".join(page + "\n" for page in pages)
+
+    @staticmethod
+    def extract_contact_info(text):
         contact = {'email': None, 'phone': None, 'linkedin': None, 'location': None}
         
         # Email
-        email_match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
+        email_match = EMAIL_RE.search(text)
         if email_match:
             contact['email'] = email_match.group(0)
             
         # Phone
-        phone_patterns = [
-            r'\+?1?\s*\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}',
-            r'\d{3}[-.\s]\d{3}[-.\s]\d{4}'
-        ]
-        for p in phone_patterns:
-            match = re.search(p, text)
+        for p in PHONE_RES:
+            match = p.search(text)
             if match:
                 contact['phone'] = match.group(0)
                 break
                 
         # LinkedIn
-        linkedin_match = re.search(r'linkedin\.com/in/[\w-]+', text, re.IGNORECASE)
+        linkedin_match = LINKEDIN_RE.search(text)
         if linkedin_match:
             contact['linkedin'] = linkedin_match.group(0)
             
         return contact
     
-    def extract_skills(self, text):
-        """Simple keyword matching for demo purposes."""
-        found_skills = []
-        text_lower = text.lower()
-        # Add more keywords as needed
-        keywords = [
-            'python', 'java', 'javascript', 'c++', 'sql', 'aws', 'azure', 'docker', 
-            'kubernetes', 'react', 'node', 'pytorch', 'tensorflow', 'scikit-learn',
-            'agile', 'scrum', 'project management', 'communication', 'leadership'
-        ]
-        
-        for k in keywords:
-            if k in text_lower:
-                found_skills.append({'name': k.title()})
-        return found_skills
-
-    def extract_experience_years(self, text):
-        # Look for patterns like "5+ years", "10 years experience"
-        patterns = [
-            r'(\d+)\+?\s*years?',
-            r'experience\s*:\s*(\d+)'
-        ]
+    @staticmethod
+    def extract_skills(text_lower):
+        """Simple keyword matching for demo purposes; expects lowercased text."""
+        return [{'name': title} for k, title in SKILL_KEYWORDS if k in text_lower]
+
+    @staticmethod
+    def extract_experience_years(text_lower):
         max_exp = 0
-        for p in patterns:
-            matches = re.findall(p, text.lower())
-            for m in matches:
-                try:
-                    val = int(m)
-                    if 0 < val < 50: # Sanity check
-                        max_exp = max(max_exp, val)
-                except:
-                    continue
+        # Stream matches; each fills exactly one of the two groups
+        for m in EXPERIENCE_RE.finditer(text_lower):
+            val = int(m.group(1) or m.group(2))
+            if max_exp < val < 50: # Sanity check
+                max_exp = val
         return max_exp
 
+    @classmethod
+    def parse_resume(cls, file_path):
+        """Extracts one resume into (profile, raw_text), or None if it has too little text."""
+        raw_text = cls.extract_text(file_path)
+        if len(raw_text) < 50:
+            return None
+
+        candidate_id = file_path.stem.replace(" ", "_")
+        role_category = file_path.parent.name
+        
+        # Metadata Extraction (one lowercased copy shared by the keyword extractors)
+        text_lower = raw_text.lower()
+        contact = cls.extract_contact_info(raw_text)
+        skills = cls.extract_skills(text_lower)
+        exp_years = cls.extract_experience_years(text_lower)
+        
+        profile = {
+            "candidate_id": candidate_id,
+            "name": candidate_id.replace("_", " "),
+            "role_category": role_category,
+            "email": contact['email'],
+            "phone": contact['phone'],
+            "skills": skills,
+            "experience_years": exp_years,
+            "resume_snippet": raw_text[:600], # First 600 chars for preview
+            "source_file": str(file_path.name)
+        }
+        return profile, raw_text
+
     def parse_directory(self):
         print(f"Scanning {BASE_PATH}...")
+        self.parsed_dir.mkdir(parents=True, exist_ok=True)
         profiles = []
         texts = []
 
         # Recursively find all resumes
+        resume_files = []
         for root, dirs, files in os.walk(BASE_PATH):
             for file in files:
-                if file.lower().endswith(('.pdf', '.docx', '.txt')):
-                    file_path = Path(root) / file
-                    self.stats['folders_scanned'] += 1
-                    
-                    # Extraction
-                    raw_text = self.extract_text(file_path)
-                    if len(raw_text) < 50:
-                        continue
-
-                    candidate_id = file_path.stem.replace(" ", "_")
-                    role_category = Path(root).name
-                    
-                    # Metadata Extraction
-                    contact = self.extract_contact_info(raw_text)
-                    skills = self.extract_skills(raw_text)
-                    exp_years = self.extract_experience_years(raw_text)
-                    
-                    profile = {
-                        "candidate_id": candidate_id,
-                        "name": candidate_id.replace("_", " "),
-                        "role_category": role_category,
-                        "email": contact['email'],
-                        "phone": contact['phone'],
-                        "skills": skills,
-                        "experience_years": exp_years,
-                        "resume_snippet": raw_text[:600], # First 600 chars for preview
-                        "source_file": str(file_path.name)
-                    }
-                    
-                    profiles.append(profile)
-                    texts.append(raw_text)
-                    self.stats['resumes_parsed'] += 1
+                if os.path.splitext(file)[1].lower() in RESUME_SUFFIXES:
+                    resume_files.append(Path(root) / file)
+        self.stats['folders_scanned'] += len(resume_files)
+
+        # Extraction is independent per file, so spread it across cores
+        for result in map_in_processes(parse_resume_file, resume_files, PARALLEL_PARSE_MIN_FILES, chunksize=4):
+            if result is None:
+                continue
+            profile, raw_text = result
+            profiles.append(profile)
+            texts.append(raw_text)
+            self.stats['resumes_parsed'] += 1
 
         if not profiles:
             print("No resumes found! Make sure they are in data/resumes/")
@@ -170,24 +196,39 @@ class EnhancedLocalResumeParser:
         
         # Vectorization
         if USE_SIMPLE_EMBEDDINGS:
-            embeddings = self.vectorizer.fit_transform(texts).toarray()
+            # One batch transform, densified once (the vectorizer already emits float32,
+            # with rows L2-normalized by TF-IDF's default norm)
+            tfidf = self.vectorizer.fit_transform(texts)
+            embeddings = tfidf.toarray()
+            # Sparse copy lets Retriever search before (or without) a FAISS index
+            sparse.save_npz(self.parsed_dir / "tfidf.npz", tfidf)
             # Save Vectorizer for query transformation later
             with open(self.parsed_dir / "vectorizer.pkl", "wb") as f:
                 pickle.dump(self.vectorizer, f)
         else:
-            embeddings = self.model.encode(texts)
+            # Normalized over the whole batch in one pass, matching the TF-IDF rows
+            embeddings = np.asarray(self.model.encode(texts, batch_size=64, normalize_embeddings=True), dtype=np.float32)
 
-        # Save Results
-        for i, profile in enumerate(profiles):
-            # Save JSON
-            with open(self.parsed_dir / f"{profile['candidate_id']}.json", "w") as f:
-                json.dump(profile, f, indent=2)
-            
-            # Save NPY
-            np.save(self.parsed_dir / f"{profile['candidate_id']}.npy", embeddings[i].astype('float32'))
+        # Save the embedding bundle: one (N, D) matrix plus row-aligned ids for build_faiss.py
+        np.save(self.parsed_dir / "all.npy", embeddings)
+        with open(self.parsed_dir / "ids.txt", "w") as f:
+            f.write("\n".join(p['candidate_id'] for p in profiles))
+        # ...and every profile in one JSON Lines file, loaded by Retriever at startup
+        with open(self.parsed_dir / "profiles.jsonl", "wb") as f:
+            f.writelines(orjson.dumps(p) + b"\n" for p in profiles)
+
+        # Save Results (embeddings live only in the all.npy bundle)
+        for profile in profiles:
+            (self.parsed_dir / f"{profile['candidate_id']}.json").write_bytes(
+                orjson.dumps(profile, option=orjson.OPT_INDENT_2)
+            )
 
         print(f"Done! Parsed {len(profiles)} resumes.")
 
+def parse_resume_file(file_path):
+    """Module-level worker entry point so the process pool can pickle it."""
+    return EnhancedLocalResumeParser.parse_resume(file_path)
+
 if __name__ == "__main__":
     parser = EnhancedLocalResumeParser()
     parser.parse_directory()
\ No newline at end of file
@@ -1,28 +1,81 @@
+import os
+import re
+import copy
 import faiss
 import pickle
 import json
+import orjson
 import numpy as np
+from scipy import sparse
 import sqlite3
+import threading
 from pathlib import Path
+from functools import lru_cache
 
 INDEX_DIR = Path("data/index")
 PARSED_DIR = Path("data/parsed")
+PROFILES_BUNDLE_PATH = PARSED_DIR / "profiles.jsonl"  # Written by parse_resumes.py
+TFIDF_MATRIX_PATH = PARSED_DIR / "tfidf.npz"  # Sparse TF-IDF rows, aligned with ids.txt
+HNSW_EF_SEARCH = 64  # Query-time search breadth for HNSW indexes
+FTS_QUERY_SQL = "SELECT candidate_id FROM profiles_fts WHERE profiles_fts MATCH ? LIMIT ?"
+# FTS5 tokens are runs of letters/digits; a query without any can't match anything
+FTS_TOKEN_RE = re.compile(r'\w')
+WORD_MASK = (1 << 64) - 1  # Splits skill bitmasks into uint64 words
+IVF_NPROBE = 16  # Inverted lists scanned per query for IVF indexes
+# Set FAISS_QUANTIZED=1 to search the int8 index (less memory, slightly lower recall)
+USE_QUANTIZED_INDEX = os.getenv("FAISS_QUANTIZED", "0") == "1"
+
+def read_index(path, mmap=False):
+    """Reads a FAISS index, memory-mapped when mmap is set so worker processes share pages.
+
+    FAISS only maps IVF inverted lists; HNSW and scalar-quantized indexes ignore
+    the flag and load fully into RAM, so callers set mmap only for IVF indexes.
+    """
+    if mmap:
+        try:
+            return faiss.read_index(str(path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass
+    return faiss.read_index(str(path))
+
+@lru_cache(maxsize=4096)
+def _load_profile_json(path_str, mtime_ns):
+    """Parsed profile JSON; the mtime in the key drops entries for re-parsed files."""
+    with open(path_str, 'rb') as f:
+        return orjson.loads(f.read())
 
 class Retriever:
     def __init__(self):
         self.index = None
         self.candidate_ids = []
         self.vectorizer = None
+        self.tfidf_matrix = None  # CSR fallback for vector search when no FAISS index exists
+        self.skill_index = {}  # lowercased skill name -> bit position
+        self.skill_masks = {}  # candidate_id -> int bitmask over skill_index
+        self.profiles = {}  # candidate_id -> profile, from the JSON Lines bundle
         self.db_path = INDEX_DIR / "meta.sqlite"
+        self._conn = None  # Opened on first keyword search, then reused
+        self._conn_lock = threading.Lock()
+        self._skill_lock = threading.Lock()
         self.load_resources()
 
     def load_resources(self):
         """Loads FAISS index, Vectorizer, and Metadata."""
         # Load FAISS
         try:
-            self.index = faiss.read_index(str(INDEX_DIR / "faiss.index"))
             with open(INDEX_DIR / "meta.json", 'r') as f:
-                self.candidate_ids = json.load(f)['candidate_ids']
+                meta = json.load(f)
+            index_path = INDEX_DIR / "faiss.index"
+            mmap = meta.get('index_type') == 'ivf'
+            if USE_QUANTIZED_INDEX and (INDEX_DIR / "faiss_sq8.index").exists():
+                index_path = INDEX_DIR / "faiss_sq8.index"
+                mmap = False
+            self.index = read_index(index_path, mmap=mmap)
+            if hasattr(self.index, 'hnsw'):
+                self.index.hnsw.efSearch = HNSW_EF_SEARCH
+            if hasattr(self.index, 'nprobe'):
+                self.index.nprobe = IVF_NPROBE
+            self.candidate_ids = meta['candidate_ids']
         except Exception:
             print("Warning: Vector index not found.")
 
@@ -33,6 +86,21 @@ class Retriever:
         except Exception:
             print("Warning: Vectorizer not found.")
 
+        # Without a FAISS index, score the sparse TF-IDF matrix directly
+        ids_path = PARSED_DIR / "ids.txt"
+        if self.index is None and self.vectorizer is not None and TFIDF_MATRIX_PATH.exists() and ids_path.exists():
+            self.tfidf_matrix = sparse.load_npz(TFIDF_MATRIX_PATH).tocsr()
+            self.candidate_ids = ids_path.read_text().splitlines()
+
+        # Load every profile up front so lookups need no disk I/O
+        try:
+            with open(PROFILES_BUNDLE_PATH, 'rb') as f:
+                for line in f:
+                    profile = orjson.loads(line)
+                    self.profiles[profile['candidate_id']] = profile
+        except FileNotFoundError:
+            pass  # Older parse output: get_profile falls back to per-candidate files
+
     def semantic_search(self, query, k=10, filters=None):
         results = {}
 
@@ -46,30 +114,38 @@ class Retriever:
             scores, indices = self.index.search(q_vec, k * 2)
             
             for score, idx in zip(scores[0], indices[0]):
-                if idx < len(self.candidate_ids):
+                if 0 <= idx < len(self.candidate_ids): # ANN indexes pad misses with -1
                     cid = self.candidate_ids[idx]
                     results[cid] = {'score': float(score), 'source': 'vector'}
+        elif self.tfidf_matrix is not None and query:
+            # TF-IDF rows and the query are L2-normalized, so the sparse dot product is cosine
+            q_vec = self.vectorizer.transform([query])
+            scores = (self.tfidf_matrix @ q_vec.T).toarray().ravel()
+            top = min(k * 2, scores.size)
+            if top:
+                for idx in np.argpartition(-scores, top - 1)[:top]:
+                    if scores[idx] > 0:
+                        results[self.candidate_ids[idx]] = {'score': float(scores[idx]), 'source': 'vector'}
 
         # 2. Keyword Search (Exact Match)
-        if query:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            # Sanitize query for FTS
-            clean_query = query.replace('"', '')
-            fts_query = f'"{clean_query}"' 
+        # Sanitize query for FTS: quoted as one phrase, so only '"' needs removing
+        clean_query = query.replace('"', '') if query else ''
+        if FTS_TOKEN_RE.search(clean_query):
             try:
-                cursor.execute("SELECT candidate_id FROM profiles_fts WHERE profiles_fts MATCH ? LIMIT ?", (fts_query, k))
-                for row in cursor.fetchall():
-                    cid = row[0]
-                    if cid in results:
-                        results[cid]['score'] += 0.2 # Boost score if keyword also matches
-                    else:
-                        results[cid] = {'score': 0.4, 'source': 'keyword'} # Base score for keyword only
-            except:
-                pass 
-            conn.close()
+                # The retriever is shared across sessions, so serialize use of the connection
+                with self._conn_lock:
+                    rows = self.get_connection().execute(FTS_QUERY_SQL, (f'"{clean_query}"', k)).fetchall()
+            except (OSError, sqlite3.Error):
+                rows = []  # Text index not built yet
+            for row in rows:
+                cid = row[0]
+                if cid in results:
+                    results[cid]['score'] += 0.2 # Boost score if keyword also matches
+                else:
+                    results[cid] = {'score': 0.4, 'source': 'keyword'} # Base score for keyword only
 
         # 3. Load Profiles & Filter
+        required_skills = frozenset(filters.get('required_skills') or ()) if filters else frozenset()
         final_list = []
         for cid, data in results.items():
             profile = self.get_profile(cid)
@@ -88,16 +164,73 @@ class Retriever:
             profile['search_score'] = data['score']
             final_list.append(profile)
 
+        # Apply Required Skills Filter (all must be present)
+        if required_skills:
+            final_list = self.filter_by_skills(final_list, required_skills)
+
         # Sort by relevance
         final_list.sort(key=lambda x: x['search_score'], reverse=True)
         return final_list[:k]
 
+    def get_connection(self):
+        """Read-only SQLite connection kept for the retriever's lifetime."""
+        if self._conn is None:
+            # Don't let connect() create an empty database before build_fts.py has run
+            if not self.db_path.exists():
+                raise FileNotFoundError(self.db_path)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA query_only=ON")
+        return self._conn
+
+    def get_skill_mask(self, profile):
+        """Bitmask of a candidate's skills, computed once per process."""
+        cid = profile['candidate_id']
+        mask = self.skill_masks.get(cid)
+        if mask is None:
+            # Sessions share this retriever; the lock keeps two new skills off the same bit
+            with self._skill_lock:
+                mask = 0
+                for s in profile.get('skills', []):
+                    bit = self.skill_index.setdefault(s['name'].lower(), len(self.skill_index))
+                    mask |= 1 << bit
+                self.skill_masks[cid] = mask
+        return mask
+
+    def filter_by_skills(self, profiles, required_skills):
+        """Keeps profiles having every required skill via a vectorized bitset AND."""
+        masks = [self.get_skill_mask(p) for p in profiles]
+        if any(s not in self.skill_index for s in required_skills):
+            return []
+
+        req_mask = 0
+        for s in required_skills:
+            req_mask |= 1 << self.skill_index[s]
+
+        # One uint64 column per 64-bit word the requirement touches (usually just one),
+        # so vocabularies larger than 64 skills still work
+        keep = np.ones(len(masks), dtype=bool)
+        word = 0
+        while req_mask >> (64 * word):
+            req = np.uint64((req_mask >> (64 * word)) & WORD_MASK)
+            if req:
+                column = np.fromiter(((m >> (64 * word)) & WORD_MASK for m in masks),
+                                     dtype=np.uint64, count=len(masks))
+                keep &= (column & req) == req
+            word += 1
+        return [p for p, k in zip(profiles, keep) if k]
+
     def get_profile(self, cid):
+        # Shallow copy: callers set 'search_score' on the returned dict
+        profile = self.profiles.get(cid)
+        if profile is not None:
+            return copy.copy(profile)
+
         path = PARSED_DIR / f"{cid}.json"
-        if path.exists():
-            with open(path, 'r') as f:
-                return json.load(f)
-        return None
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except OSError:
+            return None
+        return copy.copy(_load_profile_json(str(path), mtime_ns))
 
 def get_retriever():
     return Retriever()
\ No newline at end of file
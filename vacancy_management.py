@@ -1,45 +1,286 @@
-import json
+import atexit
+import os
+import mmap
+import orjson
+import zlib
+import hashlib
+import sqlite3
+import threading
+import numpy as np
 from pathlib import Path
+from functools import lru_cache
 from datetime import datetime
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from concurrency import Debouncer
 
 # --- Configuration ---
 PARSED_DIR = Path("data/parsed")
 VACANCY_DIR = Path("data/vacancies")
 VACANCY_DIR.mkdir(parents=True, exist_ok=True)
+VACANCY_DB_PATH = VACANCY_DIR / "vacancies.sqlite"
+SAVE_DEBOUNCE_SECONDS = 2  # Assignments within this window share one write
+MMAP_MIN_BYTES = 32 * 1024  # Smaller profiles are cheaper to read() than to map
+PARALLEL_READ_MIN_FILES = 32  # Below this, a thread pool costs more than overlapping reads saves
+
+@lru_cache(maxsize=1024)
+def _decode_profile(blob):
+    """Decompressed profile; recently matched candidates stay decoded here."""
+    return orjson.loads(zlib.decompress(blob))
+
+def _read_bytes(path):
+    """Whole file contents, or None if it can't be read."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def read_files(paths):
+    """Reads files on a thread pool when there are enough to overlap their I/O."""
+    if len(paths) < PARALLEL_READ_MIN_FILES:
+        return [_read_bytes(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=min(32, len(paths))) as ex:
+        return list(ex.map(_read_bytes, paths))
 
 class VacancyManager:
     def __init__(self):
         self.vacancy_dir = VACANCY_DIR
         self.vacancies = {}
+        self._profile_cache = {}  # file name -> (mtime_ns, compressed profile JSON)
+        self._unreadable = {}  # file name -> mtime_ns of a version that failed to load
+        self._parsed_listing = (None, [])  # (PARSED_DIR mtime_ns, profile paths)
+        self._columns = None  # Scoring arrays over the cached profiles, rebuilt when they change
+        self._open_by_role = {}  # role_name -> first 'Open' vacancy for that role
+        self._saved_digests = {}  # vacancy_id -> digest of the row last written
+        self._db_lock = threading.Lock()  # The manager is shared across Streamlit sessions
+        self._conn = self._open_store()
+        self._save_lock = threading.Lock()
+        self._dirty = set()  # vacancy_ids changed in memory but not yet written
+        self._debouncer = Debouncer(SAVE_DEBOUNCE_SECONDS, self.flush)
         self.load_vacancies()
+        atexit.register(self.flush)
+
+    def _open_store(self):
+        """One SQLite table of vacancies; WAL keeps reads concurrent with short write bursts."""
+        conn = sqlite3.connect(VACANCY_DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS vacancies(
+                vacancy_id TEXT PRIMARY KEY,
+                role_name TEXT,
+                status TEXT,
+                data BLOB NOT NULL
+            )
+        """)
+        return conn
     
     def load_vacancies(self):
-        """Loads all existing vacancy JSON files."""
-        for json_file in self.vacancy_dir.glob("*.json"):
+        """Loads all vacancies from the store, importing legacy JSON files on first run."""
+        with self._db_lock:
+            rows = self._conn.execute("SELECT vacancy_id, data FROM vacancies").fetchall()
+        if not rows:
+            self._import_json_files()
+            return
+        for vacancy_id, data in rows:
+            self.vacancies[vacancy_id] = orjson.loads(data)
+            self._saved_digests[vacancy_id] = hashlib.blake2b(data, digest_size=16).digest()
+        for vacancy in self.vacancies.values():
+            self._index_vacancy(vacancy)
+
+    def _import_json_files(self):
+        """One-time migration of per-vacancy JSON files (the old format) into the store."""
+        files = list(self.vacancy_dir.glob("*.json"))
+        imported = []
+        for json_file, payload in zip(files, read_files(files)):
             try:
-                with open(json_file, 'r') as f:
-                    vacancy = json.load(f)
-                    self.vacancies[vacancy['vacancy_id']] = vacancy
+                if payload is None:
+                    raise OSError("could not read file")
+                vacancy = orjson.loads(payload)
+                self.vacancies[vacancy['vacancy_id']] = vacancy
+                imported.append(vacancy)
             except Exception as e:
                 print(f"Error loading vacancy {json_file}: {e}")
+        for vacancy in self.vacancies.values():
+            self._index_vacancy(vacancy)
+        self._write_vacancies(imported)
     
     def save_vacancy(self, vacancy):
         """Saves a single vacancy to disk."""
-        vacancy_file = self.vacancy_dir / f"{vacancy['vacancy_id']}.json"
-        with open(vacancy_file, 'w') as f:
-            json.dump(vacancy, f, indent=2)
+        self._write_vacancies([vacancy])
+        self._register_vacancy(vacancy)
+
+    def _mark_dirty(self, vacancy_id):
+        """Schedules a write instead of saving the vacancy on every change."""
+        with self._save_lock:
+            self._dirty.add(vacancy_id)
+        self._debouncer.schedule()
+
+    def flush(self):
+        """Writes pending vacancy changes, if any, in one transaction."""
+        with self._save_lock:
+            dirty, self._dirty = self._dirty, set()
+        self._write_vacancies([self.vacancies[vid] for vid in dirty if vid in self.vacancies])
+
+    def _write_vacancies(self, vacancies):
+        """Upserts changed vacancies in a single transaction."""
+        # Snapshot, upsert and digest update form one step: otherwise the debounce
+        # timer could write an older snapshot over a newer save_vacancy and then
+        # record a digest that blocks the correction
+        with self._db_lock:
+            rows = []
+            digests = {}
+            for vacancy in vacancies:
+                payload = orjson.dumps(vacancy)
+                digest = hashlib.blake2b(payload, digest_size=16).digest()
+                # Skip rows whose stored bytes are already identical
+                if self._saved_digests.get(vacancy['vacancy_id']) != digest:
+                    rows.append((vacancy['vacancy_id'], vacancy['role_name'], vacancy['status'], payload))
+                    digests[vacancy['vacancy_id']] = digest
+            if not rows:
+                return
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO vacancies VALUES (?, ?, ?, ?)", rows)
+            self._saved_digests.update(digests)
+
+    def _register_vacancy(self, vacancy):
         self.vacancies[vacancy['vacancy_id']] = vacancy
+        self._index_vacancy(vacancy)
+
+    def _index_vacancy(self, vacancy):
+        """Keeps the role -> open vacancy lookup in step with a vacancy's status."""
+        role = vacancy['role_name']
+        current = self._open_by_role.get(role)
+        is_current = current is not None and current['vacancy_id'] == vacancy['vacancy_id']
+        if vacancy['status'] == 'Open':
+            if current is None or is_current:
+                self._open_by_role[role] = vacancy
+        elif is_current:
+            # No longer open: fall back to another open vacancy for the role, if any
+            del self._open_by_role[role]
+            for vac in self.vacancies.values():
+                if vac['role_name'] == role and vac['status'] == 'Open':
+                    self._open_by_role[role] = vac
+                    break
     
-    def create_vacancy_from_role(self, role_name):
-        """Creates a new vacancy based on a role category."""
+    def _list_parsed(self):
+        """(name, path) of each profile, re-listed only when adding/removing files bumps the directory mtime."""
+        try:
+            mtime = PARSED_DIR.stat().st_mtime_ns
+        except OSError:
+            return []  # Nothing parsed yet
+        if mtime != self._parsed_listing[0]:
+            # Raw scandir entries: no Path object per file
+            with os.scandir(PARSED_DIR) as entries:
+                listing = sorted((e.name, e.path) for e in entries if e.name.endswith('.json') and e.is_file())
+            self._parsed_listing = (mtime, listing)
+        return self._parsed_listing[1]
+
+    def _refresh_profiles(self):
+        """Re-reads only profile files whose mtime changed; returns the cache.
+
+        Entries are (mtime_ns, zlib-compressed compact JSON) so large corpora fit in RAM.
+        """
+        names = []
+        cached = {}
+        stale = []
+        large = []
+        unreadable = {}
+        for name, path in self._list_parsed():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            names.append(name)
+            hit = self._profile_cache.get(name)
+            if hit is not None and hit[0] == st.st_mtime_ns:
+                cached[name] = hit
+            elif self._unreadable.get(name) == st.st_mtime_ns:
+                unreadable[name] = st.st_mtime_ns  # Skipped until the file changes
+            elif st.st_size >= MMAP_MIN_BYTES:
+                large.append((name, path, st.st_mtime_ns))
+            else:
+                stale.append((name, path, st.st_mtime_ns))
+
+        # Small changed files are read concurrently; parsing stays on this thread
+        parsed = []
+        for (name, _, mtime), payload in zip(stale, read_files([path for _, path, _ in stale])):
+            try:
+                if payload is None:
+                    raise OSError("could not read file")
+                parsed.append((name, mtime, orjson.loads(payload)))
+            except (OSError, orjson.JSONDecodeError):
+                unreadable[name] = mtime
+        for name, path, mtime in large:
+            try:
+                parsed.append((name, mtime, _load_json_mmap(path)))
+            except (OSError, ValueError):  # ValueError covers JSONDecodeError and empty files
+                unreadable[name] = mtime
+        for name, mtime, profile in parsed:
+            # Re-dumped without the indentation before compressing
+            cached[name] = (mtime, zlib.compress(orjson.dumps(profile), 1))
+
+        # Rebuilding in directory order also drops entries for deleted profiles
+        fresh = {name: cached[name] for name in names if name in cached}
+        # Columns are rebuilt only when a cache entry was added, replaced or dropped
+        if parsed or list(fresh) != list(self._profile_cache):
+            self._columns = None
+        self._profile_cache = fresh
+        self._unreadable = unreadable
+        return fresh
+
+    def _load_profiles(self):
+        """Returns every parsed profile, decoded from the compressed cache."""
+        return [orjson.loads(zlib.decompress(blob)) for _, blob in self._refresh_profiles().values()]
+
+    def _profile_columns(self):
+        """Struct-of-arrays view of the cached profiles for vectorized scoring."""
+        cache = self._refresh_profiles()
+        if self._columns is None:
+            blobs = []
+            by_role = defaultdict(list)
+            exp = []
+            valid = []
+            skills = []
+            for _, blob in cache.values():
+                profile = orjson.loads(zlib.decompress(blob))
+                blobs.append(blob)
+                # Profiles that aren't objects or have a non-numeric experience are never matched
+                ok = isinstance(profile, dict)
+                years = profile.get('experience_years', 0) if ok else 0
+                ok = ok and isinstance(years, (int, float))
+                if ok:
+                    by_role[profile.get('role_category')].append(len(blobs) - 1)
+                exp.append(years if ok else 0)
+                valid.append(ok)
+                # Lowercased once here instead of per candidate on every match call
+                skills.append(frozenset(
+                    s['name'].lower() for s in (profile.get('skills') or ()) if isinstance(s, dict) and isinstance(s.get('name'), str)
+                ) if ok else frozenset())
+            self._columns = {
+                'blobs': blobs,  # Full profiles are decoded only for returned matches
+                # role_category -> row indices, so a role match is one fancy-index add
+                'by_role': {role: np.array(rows, dtype=np.intp) for role, rows in by_role.items()},
+                'exp': np.array(exp, dtype=np.float64),
+                'valid': np.array(valid, dtype=bool),
+                'skills': skills
+            }
+        return self._columns
+
+    def create_vacancy_from_role(self, role_name, defer_save=False):
+        """Creates a new vacancy based on a role category.
+
+        With defer_save=True the vacancy is only registered in memory; the caller writes it.
+        """
         # Check if an open vacancy already exists for this role
-        for vac in self.vacancies.values():
-            if vac['role_name'] == role_name and vac['status'] == 'Open':
-                return vac
+        existing = self._open_by_role.get(role_name)
+        if existing is not None:
+            return existing
         
-        # Generate ID
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        # Generate ID (one clock read for both the ID and created_date)
+        now = datetime.now()
+        timestamp = now.strftime('%Y%m%d%H%M%S')
         # Sanitize filename
         safe_role = role_name.replace(' ', '_').replace('/', '-').upper()
         vacancy_id = f"VAC_{safe_role}_{timestamp}"
@@ -48,7 +289,7 @@ class VacancyManager:
             'vacancy_id': vacancy_id,
             'role_name': role_name,
             'status': 'Open',  # Options: Open, On Hold, Closed, Filled
-            'created_date': datetime.now().isoformat(),
+            'created_date': now.isoformat(),
             'assigned_candidates': [],
             'requirements': {
                 'min_experience': 2, # Default baseline
@@ -59,7 +300,10 @@ class VacancyManager:
             'notes': []
         }
         
-        self.save_vacancy(vacancy)
+        if defer_save:
+            self._register_vacancy(vacancy)
+        else:
+            self.save_vacancy(vacancy)
         return vacancy
     
     def auto_create_vacancies(self):
@@ -71,19 +315,21 @@ class VacancyManager:
             return
 
         found_roles = set()
-        for json_file in PARSED_DIR.glob("*.json"):
+        for profile in self._load_profiles():
             try:
-                with open(json_file, 'r') as f:
-                    profile = json.load(f)
-                    if profile.get('role_category'):
-                        found_roles.add(profile['role_category'])
+                if profile.get('role_category'):
+                    found_roles.add(profile['role_category'])
             except:
                 continue
         
         count = 0
+        vacancies = []
         for role in found_roles:
-            self.create_vacancy_from_role(role)
+            vacancies.append(self.create_vacancy_from_role(role, defer_save=True))
             count += 1
+
+        # One commit for every new vacancy; unchanged existing ones are skipped
+        self._write_vacancies(vacancies)
             
         print(f"Processed {count} roles. Total active vacancies: {len(self.vacancies)}")
 
@@ -95,7 +341,7 @@ class VacancyManager:
         vacancy = self.vacancies[vacancy_id]
         if candidate_id not in vacancy['assigned_candidates']:
             vacancy['assigned_candidates'].append(candidate_id)
-            self.save_vacancy(vacancy)
+            self._mark_dirty(vacancy_id)
             return True
         return False
 
@@ -108,46 +354,39 @@ class VacancyManager:
         if not vacancy:
             return []
 
-        candidates = []
-        # Scan all parsed profiles
-        for json_file in PARSED_DIR.glob("*.json"):
-            try:
-                with open(json_file, 'r') as f:
-                    profile = json.load(f)
-                
-                # Simple Scoring Logic
-                score = 0
-                
-                # 1. Role Match (High Weight)
-                if profile.get('role_category') == vacancy['role_name']:
-                    score += 50
-                
-                # 2. Experience Match (Medium Weight)
-                req_exp = vacancy['requirements'].get('min_experience', 0)
-                cand_exp = profile.get('experience_years', 0)
-                if cand_exp >= req_exp:
-                    score += 20
-                
-                # 3. Text Match (Naive - Low Weight)
-                # In a real app, we would use the vector search here
-                
-                if score > 0:
-                    profile['match_score'] = score
-                    candidates.append(profile)
-            except:
-                continue
-        
-        # Sort by highest score
-        candidates.sort(key=lambda x: x['match_score'], reverse=True)
-        return candidates[:top_n]
+        requirements = vacancy['requirements']
+        req_exp = requirements.get('min_experience', 0)
+        if not isinstance(req_exp, (int, float)):
+            return []  # No candidate can be compared against this requirement
+        cols = self._profile_columns()
+
+        # Simple Scoring Logic, over every profile at once
+        scores = np.zeros(len(cols['valid']), dtype=np.int64)
+        # 1. Role Match (High Weight): only the vacancy's role bucket is touched
+        role_rows = cols['by_role'].get(vacancy['role_name'])
+        if role_rows is not None:
+            scores[role_rows] += 50
+        # 2. Experience Match (Medium Weight)
+        scores += np.where(cols['exp'] >= req_exp, 20, 0)
+        # 3. Text Match (Naive - Low Weight)
+        # In a real app, we would use the vector search here
+        scores[~cols['valid']] = 0
+
+        # Highest scores first, ties in directory order: one integer key per match
+        matched = np.flatnonzero(scores > 0)
+        keys = matched - scores[matched].astype(np.int64) * len(scores)
+        if 0 < top_n < len(keys):
+            # Partial selection, O(N), then sort only the top_n winners
+            picked = np.argpartition(keys, top_n - 1)[:top_n]
+        else:
+            picked = np.arange(len(keys))
+        order = matched[picked[np.argsort(keys[picked])]][:top_n]
+        return [{**_decode_profile(cols['blobs'][i]), 'match_score': int(scores[i])} for i in order]
 
 # Singleton Accessor for Streamlit
-_manager = None
+@lru_cache(maxsize=1)
 def get_vacancy_manager():
-    global _manager
-    if _manager is None:
-        _manager = VacancyManager()
-    return _manager
+    return VacancyManager()
 
 if __name__ == "__main__":
     print("--- Initializing Vacancy Manager ---")